@@ -1,24 +1,54 @@
+import hashlib
+import math
 import streamlit as st
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from github import Github
 
+# Number of repositories requested per page of the GitHub API (its maximum)
+PER_PAGE = 100
+
+# Maximum number of pages fetched from the GitHub API concurrently
+MAX_WORKERS = 16
+
+# Number of seconds GitHub statistics are cached between reruns
+CACHE_TTL = 300
+
+
+# Function to read the statistics of a single repository
+def get_repo_stats(repo):
+    return {
+        "name": repo.name,
+        "stars": repo.stargazers_count,
+        "forks": repo.forks_count,
+        "open_issues": repo.open_issues_count,
+        "watchers": repo.watchers_count
+    }
+
 # Function to fetch GitHub statistics
+# The token is only ever hashed into the cache key as a SHA-256 digest
+@st.cache_data(
+    ttl=CACHE_TTL,
+    show_spinner=False,
+    hash_funcs={str: lambda s: hashlib.sha256(s.encode()).hexdigest()}
+)
 def fetch_github_statistics(org_name, token):
-    g = Github(token)
+    # The repo listing already includes the counts, so the only requests made
+    # are for its pages; fetch those concurrently instead of one after another
+    g = Github(token, per_page=PER_PAGE)
     org = g.get_organization(org_name)
     repos = org.get_repos()
+    pages = math.ceil(repos.totalCount / PER_PAGE)
+    
+    if not pages:
+        return pd.DataFrame(columns=["name", "stars", "forks", "open_issues", "watchers"])
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, pages)) as executor:
+        repo_pages = list(executor.map(repos.get_page, range(pages)))
     
-    repo_stats = []
-    for repo in repos:
-        repo_stats.append({
-            "name": repo.name,
-            "stars": repo.stargazers_count,
-            "forks": repo.forks_count,
-            "open_issues": repo.open_issues_count,
-            "watchers": repo.watchers_count
-        })
+    repo_stats = [get_repo_stats(repo) for page in repo_pages for repo in page]
     
-    return repo_stats
+    return pd.DataFrame(repo_stats)
 
 # Streamlit app
 st.title("Streamlit App")
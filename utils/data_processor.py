@@ -3,38 +3,282 @@ Data Processing Utilities for the Streamlit Data App.
 This module contains functions for loading, processing, and filtering data.
 """
 
+import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import hashlib
 import io
+import os
+import tempfile
+from pathlib import Path
 
 
-def load_data(uploaded_file):
+# CSV uploads larger than this (in bytes) are parsed batch by batch with a progress bar
+LARGE_UPLOAD_THRESHOLD = 100 * 1024 * 1024
+
+# Directory holding Parquet copies of previously parsed uploads
+PARQUET_CACHE_DIR = Path(".cache")
+
+# Bump whenever parsing or dtype post-processing changes, so frames cached by
+# an older version of load_data are no longer served
+PARQUET_CACHE_VERSION = 3
+
+# String columns with fewer unique values per row than this become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _hash_dataframe(df):
+    """
+    Hash every row of a DataFrame for Streamlit's cache keys.
+    
+    Streamlit's built-in DataFrame hash only samples large frames, so edits
+    outside the sample would be served stale results. The column names and
+    dtypes are included since ``hash_pandas_object`` only covers values.
+    """
+    values_hash = pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    return tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), values_hash
+
+
+# Cache hashing for functions taking DataFrames, see _hash_dataframe
+DATAFRAME_HASH_FUNCS = {pd.DataFrame: _hash_dataframe}
+
+
+def _read_csv(buffer, dtypes=None, usecols=None, nrows=None):
+    """
+    Parse a CSV buffer, preferring the multithreaded PyArrow engine.
+    
+    Falls back to pandas' C engine only when PyArrow cannot handle the file.
+    The PyArrow engine does not support ``nrows``, so the row limit is
+    applied to its result; that way the same reader decides the dtypes
+    whether or not the read is limited.
+    """
+    try:
+        df = pd.read_csv(buffer, engine="pyarrow", dtype=dtypes, usecols=usecols)
+    except ValueError:
+        buffer.seek(0)
+        return pd.read_csv(buffer, dtype=dtypes, usecols=usecols, nrows=nrows)
+    
+    if nrows is not None:
+        df = df.iloc[:nrows]
+    return df
+
+
+def _read_csv_streaming(file_bytes, dtypes=None, usecols=None, nrows=None):
+    """
+    Parse a large CSV upload one record batch at a time, reporting progress.
+    
+    Batches are read with PyArrow's streaming reader straight from the
+    upload's bytes, so the progress bar follows the actual parse position.
+    A row-limited read stops once ``nrows`` rows have been parsed. The
+    streaming reader fixes column types from the first block, so files whose
+    later rows do not fit those types are reparsed with ``_read_csv``.
+    Declared ``dtypes`` are applied once the batches are converted.
+    """
+    source = pa.BufferReader(pa.py_buffer(file_bytes))
+    total_size = max(len(file_bytes), 1)
+    convert_options = pcsv.ConvertOptions(
+        include_columns=list(usecols) if usecols is not None else None,
+        strings_can_be_null=True
+    )
+    progress = st.progress(0.0, text="Parsing CSV…")
+    
+    try:
+        reader = pcsv.open_csv(source, convert_options=convert_options)
+        batches = []
+        rows = 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            progress.progress(min(source.tell() / total_size, 1.0), text=f"Parsed {rows:,} rows…")
+            if nrows is not None and rows >= nrows:
+                break
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+    except (NotImplementedError, TypeError, ValueError):
+        progress.empty()
+        return _read_csv(io.BytesIO(file_bytes), dtypes, usecols, nrows)
+    
+    progress.empty()
+    
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    df = table.to_pandas()
+    if dtypes:
+        df = df.astype(dtypes)
+    return df
+
+
+def _read_excel(buffer, usecols=None, nrows=None):
+    """
+    Parse an Excel buffer, preferring the Rust-based Calamine engine.
+    
+    Falls back to pandas' default engine when python-calamine is unavailable
+    or the installed pandas does not support it.
+    """
+    try:
+        return pd.read_excel(buffer, engine="calamine", usecols=usecols, nrows=nrows)
+    except (ImportError, ValueError):
+        buffer.seek(0)
+        return pd.read_excel(buffer, usecols=usecols, nrows=nrows)
+
+
+def _normalize_dates(df):
+    """
+    Convert object columns holding ``datetime.date`` values to datetime64.
+    
+    PyArrow and Calamine hand date-only values back as Python date objects,
+    while timestamps already arrive as datetime64; converting the dates makes
+    both behave the same in filtering, plotting and the Parquet cache.
+    """
+    for column in df.select_dtypes(include='object').columns:
+        if pd.api.types.infer_dtype(df[column], skipna=True) == 'date':
+            df[column] = pd.to_datetime(df[column])
+    
+    return df
+
+
+def _downcast_numerics(df, exclude=None):
+    """
+    Downcast integer and float columns to the smallest dtype that fits.
+    
+    Smaller dtypes cut the memory traffic of every later mask, groupby and
+    correlation pass. Float columns are only downcast when every value
+    survives the round trip exactly, since pandas' float downcast otherwise
+    silently drops precision. Columns named in ``exclude`` keep the dtype
+    they were loaded with.
+    """
+    exclude = exclude or {}
+    for kind, downcast in (('integer', 'integer'), ('floating', 'float')):
+        for column in df.select_dtypes(include=kind).columns:
+            if column in exclude:
+                continue
+            values = df[column]
+            downcast_values = pd.to_numeric(values, downcast=downcast)
+            if downcast_values.dtype == values.dtype:
+                continue
+            if kind == 'floating' and not downcast_values.astype(values.dtype).equals(values):
+                continue
+            df[column] = downcast_values
+    
+    return df
+
+
+def _convert_categoricals(df, exclude=None):
     """
-    Load data from an uploaded file (CSV or Excel).
+    Convert low-cardinality string columns to pandas.Categorical.
+    
+    Filtering, grouping and unique lookups on the converted columns work on
+    integer codes instead of hashing Python strings. Columns named in
+    ``exclude`` keep the dtype they were loaded with.
+    """
+    if df.empty:
+        return df
+    
+    exclude = exclude or {}
+    for column in df.select_dtypes(include=['object', 'string']).columns:
+        if column not in exclude and df[column].nunique() / len(df) < CATEGORY_MAX_RATIO:
+            df[column] = df[column].astype('category')
+    
+    return df
+
+
+def _parquet_cache_path(file_bytes, *options):
+    """
+    Return the Parquet cache location for an upload and its load options.
+    """
+    digest = hashlib.sha256(file_bytes)
+    digest.update(repr((PARQUET_CACHE_VERSION, CATEGORY_MAX_RATIO) + options).encode("utf-8"))
+    return PARQUET_CACHE_DIR / f"{digest.hexdigest()}.parquet"
+
+
+def _write_parquet_cache(df, cache_path):
+    """
+    Write a parsed DataFrame to the Parquet cache, ignoring any failure.
+    
+    The cache is only an optimization, so frames Parquet cannot store (for
+    example ones with non-string column names) are simply not cached. The
+    frame is written to a temporary file first and then moved into place,
+    so concurrent sessions never read a partially written file.
+    """
+    temp_path = None
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+        os.close(fd)
+        df.to_parquet(temp_path, engine="pyarrow", compression="zstd")
+        os.replace(temp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        if temp_path is not None:
+            Path(temp_path).unlink(missing_ok=True)
+
+
+@st.cache_data(show_spinner="Loading data…", persist="disk")
+def load_data(file_bytes, file_name, dtypes=None, usecols=None, nrows=None):
+    """
+    Load data from the contents of an uploaded file (CSV or Excel).
+    
+    Results are cached on the file contents, so reruns and re-uploads of
+    the same file skip parsing. Parsed frames are also written as Parquet
+    to ``PARQUET_CACHE_DIR`` and read back on later cold starts. That
+    directory keeps a copy of every uploaded dataset and is never evicted,
+    so clear it manually to reclaim disk space or remove user data. Call as
+    ``load_data(uploaded_file.getvalue(), uploaded_file.name)``.
     
     Parameters:
     -----------
-    uploaded_file : UploadedFile
-        The file uploaded through Streamlit's file_uploader
+    file_bytes : bytes
+        The raw contents of the file uploaded through Streamlit's file_uploader
+    file_name : str
+        The name of the uploaded file, used to detect its format
+    dtypes : dict, optional
+        Mapping of column names to dtypes, skipping type inference for CSVs
+    usecols : list, optional
+        Subset of columns to load
+    nrows : int, optional
+        Maximum number of rows to load
         
     Returns:
     --------
     pandas.DataFrame
-        Loaded data as a DataFrame
+        Loaded data as a DataFrame, with numeric columns downcast and
+        low-cardinality string columns stored as categoricals
     """
-    if uploaded_file is not None:
-        file_extension = uploaded_file.name.split(".")[-1].lower()
+    if file_bytes is not None:
+        file_extension = file_name.split(".")[-1].lower()
+        buffer = io.BytesIO(file_bytes)
+        
+        # Reuse the Parquet copy written when this upload was first parsed
+        cache_path = _parquet_cache_path(file_bytes, file_extension, dtypes, usecols, nrows)
+        if cache_path.exists():
+            try:
+                return pd.read_parquet(cache_path, engine="pyarrow")
+            except (OSError, ValueError):
+                pass
+        
+        if file_extension not in ["csv", "xlsx", "xls"]:
+            raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
         
         if file_extension == "csv":
-            return pd.read_csv(uploaded_file)
-        elif file_extension in ["xlsx", "xls"]:
-            return pd.read_excel(uploaded_file)
+            # The streaming reader only selects columns by name
+            streamable = all(isinstance(column, str) for column in usecols or [])
+            if len(file_bytes) > LARGE_UPLOAD_THRESHOLD and streamable:
+                df = _read_csv_streaming(file_bytes, dtypes, usecols, nrows)
+            else:
+                df = _read_csv(buffer, dtypes, usecols, nrows)
         else:
-            raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
+            df = _read_excel(buffer, usecols, nrows)
+        
+        df = _normalize_dates(df)
+        df = _downcast_numerics(df, exclude=dtypes)
+        df = _convert_categoricals(df, exclude=dtypes)
+        _write_parquet_cache(df, cache_path)
+        return df
     
     return None
 
 
+@st.cache_data(hash_funcs=DATAFRAME_HASH_FUNCS)
 def get_summary_statistics(df):
     """
     Generate summary statistics for a DataFrame.
@@ -52,18 +296,61 @@ def get_summary_statistics(df):
     if df is None or df.empty:
         return None
     
-    numeric_summary = df.describe().T
+    # Describe numeric and datetime columns only, falling back to all columns
+    # if there are none, then keep a row for every column so the dtype and
+    # missing counts below are reported for non-numeric columns too
+    numeric_df = df.select_dtypes(include=['number', 'datetime', 'datetimetz'])
+    if numeric_df.empty:
+        numeric_df = df
+    numeric_summary = numeric_df.describe().T.reindex(df.columns)
     
     # Add data type information
-    numeric_summary['dtype'] = df.dtypes.values
+    numeric_summary['dtype'] = df.dtypes
     
-    # Count missing values
-    numeric_summary['missing'] = df.isnull().sum().values
-    numeric_summary['missing_pct'] = (df.isnull().sum() / len(df) * 100).values
+    # Count missing values in a single pass and reuse the counts
+    null_counts = df.isnull().sum()
+    numeric_summary['missing'] = null_counts
+    numeric_summary['missing_pct'] = null_counts / len(df) * 100
     
     return numeric_summary
 
 
+@st.cache_data(hash_funcs=DATAFRAME_HASH_FUNCS)
+def get_correlation_matrix(df, columns=None):
+    """
+    Calculate the correlation matrix for the numeric columns of a DataFrame.
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        The DataFrame to analyze
+    columns : list, optional
+        List of columns to include in the correlation analysis
+        
+    Returns:
+    --------
+    pandas.DataFrame
+        Pairwise correlation matrix of the numeric columns
+    """
+    # Select only numeric columns if no columns are specified
+    if columns:
+        data = df[columns].select_dtypes(include=['number'])
+    else:
+        data = df.select_dtypes(include=['number'])
+    
+    values = data.to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    # pandas computes pairwise-complete correlations when values are missing,
+    # so only take the single-matmul NumPy path for complete data
+    if values.shape[1] == 0 or len(values) < 2 or np.isnan(values).any():
+        return data.corr()
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.corrcoef(values, rowvar=False)
+    
+    return pd.DataFrame(np.atleast_2d(corr), index=data.columns, columns=data.columns)
+
+
 def filter_dataframe(df, filters):
     """
     Apply filters to a DataFrame.
@@ -78,31 +365,39 @@ def filter_dataframe(df, filters):
     Returns:
     --------
     pandas.DataFrame
-        Filtered DataFrame
+        Filtered DataFrame. This is a new DataFrame when filters are applied,
+        and the input DataFrame itself when there is nothing to filter
     """
     if df is None or df.empty or not filters:
         return df
     
-    filtered_df = df.copy()
+    # Combine all conditions into a single mask so the frame is sliced once
+    mask = np.ones(len(df), dtype=bool)
     
     for column, condition in filters.items():
-        if column in filtered_df.columns:
+        if column in df.columns:
             if isinstance(condition, tuple) and len(condition) == 2:
                 # Range filter for numeric columns
                 min_val, max_val = condition
-                filtered_df = filtered_df[(filtered_df[column] >= min_val) & 
-                                         (filtered_df[column] <= max_val)]
+                values = df[column].to_numpy()
+                mask &= np.logical_and(values >= min_val, values <= max_val)
             elif isinstance(condition, list):
                 # Multi-select filter for categorical columns
-                filtered_df = filtered_df[filtered_df[column].isin(condition)]
+                mask &= df[column].isin(condition).to_numpy()
     
-    return filtered_df
+    # Boolean indexing already returns a new frame, so no upfront copy is needed
+    return df.loc[mask]
 
 
+@st.cache_data(hash_funcs=DATAFRAME_HASH_FUNCS)
 def convert_df_to_csv(df):
     """
     Convert DataFrame to CSV for download.
     
+    pandas writes the CSV straight into a bytes buffer in chunks, so the
+    whole file is never held as one Python str before being encoded. The
+    output is byte-for-byte what ``df.to_csv(index=False)`` produces.
+    
     Parameters:
     -----------
     df : pandas.DataFrame
@@ -110,7 +405,9 @@ def convert_df_to_csv(df):
         
     Returns:
     --------
-    str
-        CSV string representation of the DataFrame
+    bytes
+        UTF-8 encoded CSV representation of the DataFrame
     """
-    return df.to_csv(index=False).encode('utf-8')
\ No newline at end of file
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
@@ -1,15 +1,106 @@
 """
 Visualization Utilities for the Streamlit Data App.
 This module contains functions for creating various data visualizations.
+Figures are cached with st.cache_data, so every caller gets its own copy.
 """
 
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import numpy as np
+from numba import njit
 
+from .data_processor import DATAFRAME_HASH_FUNCS, get_correlation_matrix
 
+
+# Lets matplotlib drop line segments that do not change the rendered path.
+# Applied with plt.rc_context around each chart function only, so other plots
+# in the app keep their settings; paths pick the threshold up when they are
+# built, which tight_layout() forces to happen inside the context.
+CHART_RC_PARAMS = {'path.simplify_threshold': 1.0}
+
+# Maximum number of figures kept per chart function in Streamlit's cache
+FIGURE_CACHE_MAX_ENTRIES = 32
+
+# Maximum number of points drawn in a scatter plot
+SCATTER_MAX_POINTS = 10_000
+
+# Largest correlation matrix whose cells are annotated with their values
+HEATMAP_MAX_ANNOTATED = 20
+
+# Number of evenly spaced points the histogram KDE is evaluated on
+KDE_GRID_SIZE = 512
+
+
+def _new_figure(figsize=(10, 6)):
+    """
+    Create a figure with a single set of axes, outside of pyplot's state.
+    
+    Figures are not registered with pyplot's figure manager, so they never
+    need to be closed and are garbage-collected once no longer referenced.
+    """
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    return fig, ax
+
+
+@njit(cache=True, fastmath=True)
+def _fast_kde(x, grid):
+    """
+    Evaluate a Gaussian kernel density estimate of ``x`` on an even ``grid``.
+    
+    The data is first linearly binned onto the grid in a single pass, then
+    the binned counts are convolved with the kernel, so the cost is
+    O(len(x) + len(grid)**2) rather than O(len(x) * len(grid)). The
+    bandwidth follows Scott's rule, matching scipy's gaussian_kde default.
+    """
+    n = x.shape[0]
+    n_grid = grid.shape[0]
+    start = grid[0]
+    step = (grid[n_grid - 1] - start) / (n_grid - 1)
+    
+    # Linear binning of the data onto the grid
+    weights = np.zeros(n_grid)
+    for value in x:
+        position = (value - start) / step
+        index = int(np.floor(position))
+        if index < 0:
+            weights[0] += 1.0
+        elif index >= n_grid - 1:
+            weights[n_grid - 1] += 1.0
+        else:
+            fraction = position - index
+            weights[index] += 1.0 - fraction
+            weights[index + 1] += fraction
+    
+    bandwidth = np.std(x) * n ** (-0.2)
+    
+    # Sample the kernel at every grid offset and normalize it by its discrete
+    # sum, so the estimate keeps unit mass even when the bandwidth is smaller
+    # than the grid step and the continuous normalizing constant would not hold
+    kernel = np.empty(n_grid)
+    for k in range(n_grid):
+        u = k * step / bandwidth
+        kernel[k] = np.exp(-0.5 * u * u)
+    kernel_sum = 2.0 * kernel.sum() - kernel[0]
+    norm = 1.0 / (n * step * kernel_sum)
+    
+    # Convolve the binned counts with the Gaussian kernel
+    density = np.zeros(n_grid)
+    for i in range(n_grid):
+        total = 0.0
+        for j in range(n_grid):
+            if weights[j] > 0.0:
+                total += weights[j] * kernel[abs(i - j)]
+        density[i] = total * norm
+    
+    return density
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_MAX_ENTRIES, hash_funcs=DATAFRAME_HASH_FUNCS)
+@plt.rc_context(CHART_RC_PARAMS)
 def create_histogram(df, column, bins=20, kde=True):
     """
     Create a histogram for the selected column.
@@ -30,15 +121,34 @@ def create_histogram(df, column, bins=20, kde=True):
     matplotlib.figure.Figure
         The histogram figure
     """
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.histplot(data=df, x=column, bins=bins, kde=kde, ax=ax)
+    fig, ax = _new_figure()
+    
+    if pd.api.types.is_numeric_dtype(df[column]):
+        values = df[column].dropna().to_numpy(dtype=np.float64)
+        
+        # Bin the data once in NumPy and draw the precomputed counts
+        counts, edges = np.histogram(values, bins=bins)
+        ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', edgecolor='white')
+        
+        if kde and len(values) > 1 and np.ptp(values) > 0:
+            # Estimate the density over the full data and scale it to the bin counts
+            grid = np.linspace(edges[0], edges[-1], KDE_GRID_SIZE)
+            density = _fast_kde(values, grid)
+            ax.plot(grid, density * len(values) * (edges[1] - edges[0]))
+    else:
+        # Categorical, string and datetime columns need seaborn's discrete
+        # bars or date axis
+        sns.histplot(data=df, x=column, bins=bins, kde=kde, ax=ax)
+    
     ax.set_title(f'Histogram of {column}')
     ax.set_xlabel(column)
     ax.set_ylabel('Frequency')
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
+@st.cache_data(max_entries=FIGURE_CACHE_MAX_ENTRIES, hash_funcs=DATAFRAME_HASH_FUNCS)
+@plt.rc_context(CHART_RC_PARAMS)
 def create_scatter_plot(df, x_column, y_column, color_column=None):
     """
     Create a scatter plot for the selected columns.
@@ -59,24 +169,32 @@ def create_scatter_plot(df, x_column, y_column, color_column=None):
     matplotlib.figure.Figure
         The scatter plot figure
     """
-    fig, ax = plt.subplots(figsize=(10, 6))
+    # Draw a random subsample of large frames; the overall shape is unchanged
+    if len(df) > SCATTER_MAX_POINTS:
+        plot_df = df.sample(SCATTER_MAX_POINTS, random_state=0)
+    else:
+        plot_df = df
+    
+    fig, ax = _new_figure()
     
     if color_column and color_column in df.columns:
-        scatter = sns.scatterplot(data=df, x=x_column, y=y_column, hue=color_column, ax=ax)
+        scatter = sns.scatterplot(data=plot_df, x=x_column, y=y_column, hue=color_column, ax=ax)
         
         # If there are too many categories, adjust the legend
-        if df[color_column].nunique() > 10:
-            plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        if plot_df[color_column].nunique() > 10:
+            ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
     else:
-        scatter = sns.scatterplot(data=df, x=x_column, y=y_column, ax=ax)
+        scatter = sns.scatterplot(data=plot_df, x=x_column, y=y_column, ax=ax)
     
     ax.set_title(f'Scatter Plot: {y_column} vs {x_column}')
     ax.set_xlabel(x_column)
     ax.set_ylabel(y_column)
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
+@st.cache_data(max_entries=FIGURE_CACHE_MAX_ENTRIES, hash_funcs=DATAFRAME_HASH_FUNCS)
+@plt.rc_context(CHART_RC_PARAMS)
 def create_bar_chart(df, x_column, y_column, top_n=None):
     """
     Create a bar chart for the selected columns.
@@ -97,29 +215,33 @@ def create_bar_chart(df, x_column, y_column, top_n=None):
     matplotlib.figure.Figure
         The bar chart figure
     """
-    # Group and aggregate the data
-    chart_data = df.groupby(x_column)[y_column].sum().reset_index()
+    # Group and aggregate the data, skipping unobserved categories
+    totals = df.groupby(x_column, sort=not top_n, observed=True)[y_column].sum()
     
-    # Sort and limit to top N if specified
+    # Select the top N by partial selection instead of a full sort
     if top_n:
-        chart_data = chart_data.sort_values(y_column, ascending=False).head(top_n)
+        totals = totals.nlargest(top_n)
+    
+    chart_data = totals.reset_index()
     
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = _new_figure()
     
-    # Create the bar chart
-    sns.barplot(data=chart_data, x=x_column, y=y_column, ax=ax)
+    # Create the bar chart, keeping unobserved categories off the axis
+    sns.barplot(data=chart_data, x=x_column, y=y_column, order=chart_data[x_column].tolist(), ax=ax)
     
     # Rotate x-axis labels if there are too many categories
     if len(chart_data) > 5:
-        plt.xticks(rotation=45, ha='right')
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
     
     ax.set_title(f'Bar Chart: {y_column} by {x_column}')
     ax.set_xlabel(x_column)
     ax.set_ylabel(y_column)
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
+@st.cache_data(max_entries=FIGURE_CACHE_MAX_ENTRIES, hash_funcs=DATAFRAME_HASH_FUNCS)
+@plt.rc_context(CHART_RC_PARAMS)
 def create_line_chart(df, x_column, y_column, group_column=None):
     """
     Create a line chart for the selected columns.
@@ -140,12 +262,17 @@ def create_line_chart(df, x_column, y_column, group_column=None):
     matplotlib.figure.Figure
         The line chart figure
     """
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = _new_figure()
     
     if group_column and group_column in df.columns:
-        for group, data in df.groupby(group_column):
-            data = data.sort_values(x_column)
-            ax.plot(data[x_column], data[y_column], marker='o', label=group)
+        # Sort once by group and x so each group is a contiguous slice
+        sorted_data = df.sort_values([group_column, x_column])
+        x_values = sorted_data[x_column].to_numpy()
+        y_values = sorted_data[y_column].to_numpy()
+        
+        for group, positions in sorted_data.groupby(group_column, sort=False, observed=True).indices.items():
+            start, end = positions[0], positions[-1] + 1
+            ax.plot(x_values[start:end], y_values[start:end], marker='o', label=group)
         ax.legend(title=group_column)
     else:
         sorted_data = df.sort_values(x_column)
@@ -157,12 +284,14 @@ def create_line_chart(df, x_column, y_column, group_column=None):
     
     # Rotate x-axis labels if there are too many unique values
     if df[x_column].nunique() > 5:
-        plt.xticks(rotation=45, ha='right')
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
+@st.cache_data(max_entries=FIGURE_CACHE_MAX_ENTRIES, hash_funcs=DATAFRAME_HASH_FUNCS)
+@plt.rc_context(CHART_RC_PARAMS)
 def create_correlation_heatmap(df, columns=None):
     """
     Create a correlation heatmap for the selected columns.
@@ -179,18 +308,16 @@ def create_correlation_heatmap(df, columns=None):
     matplotlib.figure.Figure
         The correlation heatmap figure
     """
-    # Select only numeric columns if no columns are specified
-    if columns:
-        data = df[columns].select_dtypes(include=['number'])
-    else:
-        data = df.select_dtypes(include=['number'])
-    
-    # Calculate the correlation matrix
-    corr_matrix = data.corr()
+    # Calculate the correlation matrix (cached separately from the rendering)
+    corr_matrix = get_correlation_matrix(df, columns)
     
     # Create the heatmap
-    fig, ax = plt.subplots(figsize=(10, 8))
-    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0, ax=ax)
+    fig, ax = _new_figure(figsize=(10, 8))
+    
+    # Annotating every cell is O(K^2) text draws, so only do it for small
+    # matrices; seaborn already thins out the tick labels to fit the axes
+    annotate = corr_matrix.shape[0] <= HEATMAP_MAX_ANNOTATED
+    sns.heatmap(corr_matrix, annot=annotate, cmap='coolwarm', center=0, ax=ax)
     ax.set_title('Correlation Matrix')
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
\ No newline at end of file